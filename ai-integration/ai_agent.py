@@ -10,21 +10,324 @@ Example:
 """
 
 import os
-import json
-import requests
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
+import time
+import weakref
+import asyncio
+import functools
+import hashlib
+import logging
+import re
+import diskcache
+import httpx
+import orjson
+import tiktoken
+from cachetools import TTLCache
+from typing import Awaitable, Callable, Dict, Any, Hashable, List, Optional, Tuple
+from openai import AsyncOpenAI
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 
+logger = logging.getLogger(__name__)
+
 # Nimbus API base URL (assumes Nimbus is running locally)
 NIMBUS_BASE_URL = os.getenv("NIMBUS_BASE_URL", "http://localhost:8080")
 
+# Upper bound on in-flight Nimbus requests while the agent fans out tool
+# calls. Clamped to 1: a zero-sized semaphore would hang every tool call.
+NIMBUS_MAX_TOOL_CONCURRENCY = max(1, int(os.getenv("NIMBUS_MAX_TOOL_CONCURRENCY", "8")))
+
+# Gateway errors worth retrying. 4xx responses are never retried: a bad
+# request will not get better by sending it again.
+_RETRY_STATUSES = (502, 503, 504)
+
+# POST is not idempotent without Redis (the gateway then runs with
+# idempotency disabled), and with Redis a retry that races the first
+# attempt gets a 409. So a POST is only retried when it cannot have
+# reached the handler: the connection never opened, or the gateway
+# answered 502/503 in front of it. A 504 or read timeout may come after
+# the notification was already created.
+_POST_RETRY_STATUSES = (502, 503)
+_POST_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Shared by the sync client below and the async client the agent opens per run.
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=16, max_connections=32, keepalive_expiry=60
+)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Shared HTTP client so every Nimbus call after the first reuses the same
+# connection instead of paying a fresh TCP (+TLS) handshake. Over HTTPS,
+# HTTP/2 also multiplexes concurrent requests onto that one connection;
+# against a plain http:// Nimbus it falls back to HTTP/1.1 keep-alive.
+_CLIENT = httpx.Client(
+    base_url=NIMBUS_BASE_URL, http2=True, timeout=5.0, limits=_HTTP_LIMITS
+)
+
+
+def _json_dumps(obj: Any) -> str:
+    """orjson-backed json.dumps replacement (orjson returns bytes)."""
+    return orjson.dumps(obj).decode()
+
+
+def _is_post(exc: httpx.HTTPError) -> bool:
+    try:
+        return exc.request.method == "POST"
+    except RuntimeError:
+        # No request attached: assume the worst
+        return True
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Timeouts, connection errors and gateway 5xx are retried; 4xx is not."""
+    if not isinstance(exc, httpx.HTTPError):
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        statuses = _POST_RETRY_STATUSES if _is_post(exc) else _RETRY_STATUSES
+        return exc.response.status_code in statuses
+    if _is_post(exc):
+        return isinstance(exc, _POST_RETRY_ERRORS)
+    return isinstance(exc, httpx.TransportError)
+
+
+# Transient failures are retried with exponential backoff, so they are
+# absorbed inside one tool call instead of costing another LLM round trip.
+# POSTs are only retried when the request never reached the handler; see
+# _POST_RETRY_ERRORS.
+_retry_transient = retry(
+    wait=wait_exponential_jitter(initial=0.2, max=2.0),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception(_is_transient),
+    reraise=True,
+)
+
+
+# ============================================================
+# Circuit breaker
+# ============================================================
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Fail fast while Nimbus is down instead of waiting out a timeout on
+    every request. Same state machine as internal/circuitbreaker:
+    
+        closed -> open:       after failure_threshold consecutive failures
+        open -> half-open:    once reset_timeout seconds have passed
+        half-open -> closed:  when the probe request succeeds
+        half-open -> open:    when the probe request fails
+    
+    Like HalfOpenMaxRequests: 1 there, half-open admits a single probe at a
+    time; everything else is rejected until the probe has an outcome.
+    """
+    
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+    
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+    
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True
+        return True
+    
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+    
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == "half-open" or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+    
+    def release(self) -> None:
+        """Give up a half-open probe that ended without an outcome (e.g. cancelled)."""
+        self._probing = False
+
+
+_BREAKER = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+
+_NIMBUS_UNAVAILABLE = {
+    "error": "nimbus_unavailable",
+    "status": "failed",
+    "message": "Nimbus is failing repeatedly. Ask the user to retry shortly.",
+}
+
+
+def _is_outage(exc: BaseException) -> bool:
+    """True if the error means Nimbus itself is unhealthy, not that the request was bad."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return True
+
+
+def _record_outcome(exc: httpx.HTTPError) -> None:
+    if _is_outage(exc):
+        _BREAKER.record_failure()
+    else:
+        _BREAKER.record_success()
+
+
+# Errors a tool reports back to the LLM instead of raising.
+_NIMBUS_ERRORS = (httpx.HTTPError, orjson.JSONDecodeError, CircuitOpenError)
+
+
+def _error_result(exc: BaseException, **fields: Any) -> Dict[str, Any]:
+    """Tool result for a failed Nimbus call (httpx timeouts often have an empty message)."""
+    if isinstance(exc, CircuitOpenError):
+        return {**_NIMBUS_UNAVAILABLE, **fields}
+    return {"error": str(exc) or repr(exc), **fields}
+
+
+# ============================================================
+# Read cache
+# ============================================================
+
+# The LLM tends to poll the same notification or re-list the same tenant on
+# consecutive iterations. Successful reads are kept for 2s so those polls
+# skip the round trip; create_notification() invalidates the list cache.
+_STATUS_CACHE: TTLCache = TTLCache(maxsize=128, ttl=2)
+_LIST_CACHE: TTLCache = TTLCache(maxsize=128, ttl=2)
+
+
+def _cache_lookup(cache: TTLCache, key: Hashable, label: str) -> Optional[Dict[str, Any]]:
+    result = cache.get(key)
+    logger.debug("%s cache %s: %s", label, "hit" if result is not None else "miss", key)
+    return result
+
 
 # ============================================================
 # Tool implementations (these call real Nimbus APIs)
 # ============================================================
 
 
+@_retry_transient
+def _send(method: str, path: str, **kwargs: Any) -> httpx.Response:
+    # The breaker sees every attempt, so retries stop as soon as it opens
+    # and a failed half-open probe reopens it without retrying.
+    if not _BREAKER.allow_request():
+        raise CircuitOpenError()
+    try:
+        resp = _CLIENT.request(method, path, **kwargs)
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        _record_outcome(e)
+        raise
+    except BaseException:
+        _BREAKER.release()
+        raise
+    _BREAKER.record_success()
+    return resp
+
+
+def _request_json(method: str, path: str, **kwargs: Any) -> Any:
+    """Call Nimbus over the shared client and decode the JSON response."""
+    resp = _send(method, path, **kwargs)
+    return orjson.loads(resp.content)
+
+
+def _notification_request(
+    tenant_id: str,
+    user_id: str,
+    channel: str,
+    recipient: str,
+    subject: Optional[str] = None,
+    body: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the POST /v1/notifications request body."""
+    payload = {"to": recipient}
+    if subject:
+        payload["subject"] = subject
+    if body:
+        payload["body"] = body
+    
+    return {
+        "tenant_id": tenant_id,
+        "user_id": user_id,
+        "channel": channel,
+        "payload": payload,
+    }
+
+
+def _created_result(result: Dict[str, Any], channel: str) -> Dict[str, Any]:
+    return {
+        "notification_id": result.get("id"),
+        "status": "created",
+        "message": f"{channel.capitalize()} notification created successfully",
+    }
+
+
+def _status_result(notif: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": notif.get("id"),
+        "status": notif.get("status", "unknown"),
+        "channel": notif.get("channel"),
+        "created_at": notif.get("created_at"),
+    }
+
+
+_INVALID_RECIPIENTS = {
+    "error": "invalid_recipients",
+    "status": "failed",
+    "message": "recipients must be a list of strings.",
+}
+
+
+def _bulk_recipients(recipients: Any) -> Optional[List[str]]:
+    """
+    Normalize the recipients the LLM passed to a bulk tool.
+    
+    A bare string is one recipient, not one per character. Anything else
+    that is not a list of strings is rejected (None) before any send.
+    """
+    if isinstance(recipients, str):
+        return [recipients]
+    if isinstance(recipients, list) and all(isinstance(r, str) for r in recipients):
+        return recipients
+    return None
+
+
+def _bulk_result(recipients: List[str], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    failed = sum(1 for r in results if "error" in r)
+    return {
+        "results": [dict(r, recipient=rcpt) for rcpt, r in zip(recipients, results)],
+        "created": len(results) - failed,
+        "failed": failed,
+    }
+
+
+def _list_result(notifs: List[Dict[str, Any]], tenant_id: str) -> Dict[str, Any]:
+    return {
+        "notifications": notifs,
+        "count": len(notifs),
+        "tenant_id": tenant_id,
+    }
+
+
 def create_notification(
     tenant_id: str,
     user_id: str,
@@ -47,34 +350,44 @@ def create_notification(
     Returns:
         {"notification_id": "uuid", "status": "created"}
     """
-    payload = {"to": recipient}
-    if subject:
-        payload["subject"] = subject
-    if body:
-        payload["body"] = body
-    
-    data = {
-        "tenant_id": tenant_id,
-        "user_id": user_id,
-        "channel": channel,
-        "payload": payload,
-    }
+    data = _notification_request(tenant_id, user_id, channel, recipient, subject, body)
     
     try:
-        resp = requests.post(
-            f"{NIMBUS_BASE_URL}/v1/notifications",
-            json=data,
-            timeout=5,
+        result = _request_json(
+            "POST", "/v1/notifications", content=orjson.dumps(data), headers=_JSON_HEADERS
         )
-        resp.raise_for_status()
-        result = resp.json()
-        return {
-            "notification_id": result.get("id"),
-            "status": "created",
-            "message": f"{channel.capitalize()} notification created successfully",
-        }
-    except requests.RequestException as e:
-        return {"error": str(e), "status": "failed"}
+        _LIST_CACHE.clear()
+        return _created_result(result, channel)
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, status="failed")
+
+
+def create_notifications_bulk(
+    tenant_id: str,
+    user_id: str,
+    channel: str,
+    recipients: List[str],
+    subject: Optional[str] = None,
+    body: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Send the same notification to several recipients on one channel.
+    
+    Nimbus has no batch endpoint, so this issues one create per recipient.
+    The agent uses the async variant, which sends them concurrently.
+    
+    Returns:
+        {"results": [...], "created": 3, "failed": 0}
+    """
+    recipients = _bulk_recipients(recipients)
+    if recipients is None:
+        return dict(_INVALID_RECIPIENTS)
+    
+    results = [
+        create_notification(tenant_id, user_id, channel, recipient, subject, body)
+        for recipient in recipients
+    ]
+    return _bulk_result(recipients, results)
 
 
 def get_notification_status(notification_id: str) -> Dict[str, Any]:
@@ -87,21 +400,16 @@ def get_notification_status(notification_id: str) -> Dict[str, Any]:
     Returns:
         {"id": "uuid", "status": "pending|delivered|failed", "channel": "email"}
     """
+    cached = _cache_lookup(_STATUS_CACHE, notification_id, "status")
+    if cached is not None:
+        return cached
+    
     try:
-        resp = requests.get(
-            f"{NIMBUS_BASE_URL}/v1/notifications/{notification_id}",
-            timeout=5,
-        )
-        resp.raise_for_status()
-        notif = resp.json()
-        return {
-            "id": notif.get("id"),
-            "status": notif.get("status", "unknown"),
-            "channel": notif.get("channel"),
-            "created_at": notif.get("created_at"),
-        }
-    except requests.RequestException as e:
-        return {"error": str(e), "status": "failed"}
+        notif = _request_json("GET", f"/v1/notifications/{notification_id}")
+        result = _STATUS_CACHE[notification_id] = _status_result(notif)
+        return result
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, status="failed")
 
 
 def list_notifications(tenant_id: str, limit: int = 10) -> Dict[str, Any]:
@@ -115,21 +423,156 @@ def list_notifications(tenant_id: str, limit: int = 10) -> Dict[str, Any]:
     Returns:
         {"notifications": [...], "count": 5}
     """
+    cached = _cache_lookup(_LIST_CACHE, (tenant_id, limit), "list")
+    if cached is not None:
+        return cached
+    
     try:
-        resp = requests.get(
-            f"{NIMBUS_BASE_URL}/v1/notifications",
+        notifs = _request_json(
+            "GET",
+            "/v1/notifications",
             params={"tenant_id": tenant_id, "limit": limit},
-            timeout=5,
         )
-        resp.raise_for_status()
-        notifs = resp.json()
-        return {
-            "notifications": notifs,
-            "count": len(notifs),
-            "tenant_id": tenant_id,
-        }
-    except requests.RequestException as e:
-        return {"error": str(e), "notifications": []}
+        result = _LIST_CACHE[(tenant_id, limit)] = _list_result(notifs, tenant_id)
+        return result
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, notifications=[])
+
+
+# ============================================================
+# Async tool implementations (used by the agent loop so that
+# several tool calls from one LLM turn run concurrently)
+# ============================================================
+
+# One semaphore per event loop: asyncio primitives are bound to the loop
+# they first wait on, and every run_agent() call starts a fresh loop.
+_TOOL_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _tool_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _TOOL_SEMAPHORES.get(loop)
+    if sem is None:
+        sem = _TOOL_SEMAPHORES[loop] = asyncio.Semaphore(NIMBUS_MAX_TOOL_CONCURRENCY)
+    return sem
+
+
+@_retry_transient
+async def _asend(
+    session: httpx.AsyncClient, method: str, path: str, **kwargs: Any
+) -> httpx.Response:
+    # The slot is taken per attempt, so it is released during retry backoff.
+    async with _tool_semaphore():
+        if not _BREAKER.allow_request():
+            raise CircuitOpenError()
+        try:
+            resp = await session.request(method, path, **kwargs)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            _record_outcome(e)
+            raise
+        except BaseException:
+            _BREAKER.release()
+            raise
+    _BREAKER.record_success()
+    return resp
+
+
+async def _arequest_json(
+    session: httpx.AsyncClient, method: str, path: str, **kwargs: Any
+) -> Any:
+    """
+    Async variant of _request_json().
+    
+    Concurrency is capped per HTTP attempt in _asend() rather than per tool
+    call, so a single create_notifications_bulk fan-out is throttled too.
+    """
+    resp = await _asend(session, method, path, **kwargs)
+    return orjson.loads(resp.content)
+
+
+async def _acreate_notification(
+    session: httpx.AsyncClient,
+    tenant_id: str,
+    user_id: str,
+    channel: str,
+    recipient: str,
+    subject: Optional[str] = None,
+    body: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Async variant of create_notification()."""
+    data = _notification_request(tenant_id, user_id, channel, recipient, subject, body)
+    
+    try:
+        result = await _arequest_json(
+            session, "POST", "/v1/notifications", content=orjson.dumps(data), headers=_JSON_HEADERS
+        )
+        _LIST_CACHE.clear()
+        return _created_result(result, channel)
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, status="failed")
+
+
+async def _acreate_notifications_bulk(
+    session: httpx.AsyncClient,
+    tenant_id: str,
+    user_id: str,
+    channel: str,
+    recipients: List[str],
+    subject: Optional[str] = None,
+    body: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Async variant of create_notifications_bulk(); all creates run concurrently."""
+    recipients = _bulk_recipients(recipients)
+    if recipients is None:
+        return dict(_INVALID_RECIPIENTS)
+    
+    results = await asyncio.gather(
+        *(
+            _acreate_notification(session, tenant_id, user_id, channel, recipient, subject, body)
+            for recipient in recipients
+        )
+    )
+    return _bulk_result(recipients, list(results))
+
+
+async def _aget_notification_status(
+    session: httpx.AsyncClient, notification_id: str
+) -> Dict[str, Any]:
+    """Async variant of get_notification_status()."""
+    cached = _cache_lookup(_STATUS_CACHE, notification_id, "status")
+    if cached is not None:
+        return cached
+    
+    try:
+        notif = await _arequest_json(session, "GET", f"/v1/notifications/{notification_id}")
+        result = _STATUS_CACHE[notification_id] = _status_result(notif)
+        return result
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, status="failed")
+
+
+async def _alist_notifications(
+    session: httpx.AsyncClient, tenant_id: str, limit: int = 10
+) -> Dict[str, Any]:
+    """Async variant of list_notifications()."""
+    cached = _cache_lookup(_LIST_CACHE, (tenant_id, limit), "list")
+    if cached is not None:
+        return cached
+    
+    try:
+        notifs = await _arequest_json(
+            session,
+            "GET",
+            "/v1/notifications",
+            params={"tenant_id": tenant_id, "limit": limit},
+        )
+        result = _LIST_CACHE[(tenant_id, limit)] = _list_result(notifs, tenant_id)
+        return result
+    except _NIMBUS_ERRORS as e:
+        return _error_result(e, notifications=[])
 
 
 # ============================================================
@@ -175,6 +618,48 @@ NIMBUS_TOOLS = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "create_notifications_bulk",
+            "description": (
+                "Send the same notification to several recipients on one channel in a single call. "
+                "Prefer this over repeated create_notification calls."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "tenant_id": {
+                        "type": "string",
+                        "description": "Tenant UUID (use default: 00000000-0000-0000-0000-000000000001)",
+                    },
+                    "user_id": {
+                        "type": "string",
+                        "description": "User UUID (use default: 00000000-0000-0000-0000-000000000002)",
+                    },
+                    "channel": {
+                        "type": "string",
+                        "enum": ["email", "sms", "webhook"],
+                        "description": "Notification channel",
+                    },
+                    "recipients": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Email addresses, phone numbers, or webhook URLs",
+                    },
+                    "subject": {
+                        "type": "string",
+                        "description": "Email subject (optional, for email channel only)",
+                    },
+                    "body": {
+                        "type": "string",
+                        "description": "Notification body/message content",
+                    },
+                },
+                "required": ["tenant_id", "user_id", "channel", "recipients"],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -222,101 +707,418 @@ NIMBUS_TOOLS = [
 # ============================================================
 
 
+_DISPATCH: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "create_notification": create_notification,
+    "create_notifications_bulk": create_notifications_bulk,
+    "get_notification_status": get_notification_status,
+    "list_notifications": list_notifications,
+}
+
+_ASYNC_DISPATCH: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]] = {
+    "create_notification": _acreate_notification,
+    "create_notifications_bulk": _acreate_notifications_bulk,
+    "get_notification_status": _aget_notification_status,
+    "list_notifications": _alist_notifications,
+}
+
+
 def execute_function(func_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """Execute the requested function with parsed arguments."""
-    if func_name == "create_notification":
-        return create_notification(**arguments)
-    elif func_name == "get_notification_status":
-        return get_notification_status(**arguments)
-    elif func_name == "list_notifications":
-        return list_notifications(**arguments)
-    else:
+    if _BREAKER.state == "open":
+        return dict(_NIMBUS_UNAVAILABLE)
+    func = _DISPATCH.get(func_name)
+    if func is None:
+        return {"error": f"Unknown function: {func_name}"}
+    return func(**arguments)
+
+
+async def execute_function_async(
+    session: httpx.AsyncClient, func_name: str, arguments: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Async counterpart of execute_function(), sharing one HTTP session."""
+    if _BREAKER.state == "open":
+        return dict(_NIMBUS_UNAVAILABLE)
+    func = _ASYNC_DISPATCH.get(func_name)
+    if func is None:
         return {"error": f"Unknown function: {func_name}"}
+    return await func(session, **arguments)
 
 
 # ============================================================
 # LLM orchestration
 # ============================================================
 
+_SYSTEM_MSG = (
+    "You are Nimbus AI, an assistant that manages notifications. "
+    "You can create notifications, check their status, and list recent notifications. "
+    "When sending to multiple recipients on the same channel, use create_notifications_bulk. "
+    "Use UUIDs: tenant_id=00000000-0000-0000-0000-000000000001, "
+    "user_id=00000000-0000-0000-0000-000000000002 as defaults. "
+    "Be concise and friendly."
+)
+
+# Request parameters that are identical for every completion. Built once at
+# import instead of on every iteration of the agent loop.
+_COMPLETION_PARAMS: Dict[str, Any] = {
+    "model": "gpt-4o-mini",
+    "tools": NIMBUS_TOOLS,
+    "tool_choice": "auto",
+    "temperature": 0.2,
+    "stream": True,
+}
+
+# Once the history passes this many tokens, all but the most recent tool
+# rounds are folded into a one-line summary so input tokens stay bounded.
+_HISTORY_TOKEN_BUDGET = 4000
+_KEEP_RECENT_ROUNDS = 2
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding() -> Optional[tiktoken.Encoding]:
+    """The model's tokenizer, or None if it cannot be loaded (cached either way)."""
+    try:
+        return tiktoken.encoding_for_model(_COMPLETION_PARAMS["model"])
+    except Exception:
+        # The first load downloads the BPE file; by the time we get here the
+        # round's tool calls have already been sent, so never let a failed
+        # download abort the run.
+        logger.debug("tiktoken unavailable, estimating tokens from length", exc_info=True)
+        return None
+
+
+def _count_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Approximate prompt size: message text plus tool call arguments."""
+    texts: List[str] = []
+    for message in messages:
+        texts.append(message.get("content") or "")
+        for call in message.get("tool_calls") or []:
+            texts.append(call["function"]["arguments"])
+    
+    encoding = _encoding()
+    if encoding is None:
+        return sum(len(text) for text in texts) // 4
+    return sum(len(encoding.encode(text)) for text in texts)
+
+
+def _summarize_rounds(messages: List[Dict[str, Any]]) -> str:
+    """One-line digest of the tool results (and earlier digests) in messages."""
+    earlier: List[str] = []
+    created: List[str] = []
+    statuses: List[str] = []
+    listings = errors = 0
+    
+    for message in messages:
+        if message["role"] == "assistant" and not message.get("tool_calls"):
+            earlier.append(message["content"])
+            continue
+        if message["role"] != "tool":
+            continue
+        
+        # Tool results echo whatever Nimbus returned, so any field may be
+        # missing or null; the summary must never abort a run mid-way.
+        result = orjson.loads(message["content"])
+        if "error" in result:
+            errors += 1
+        elif message["name"] == "create_notification":
+            created.append(str(result.get("notification_id")))
+        elif message["name"] == "create_notifications_bulk":
+            created.extend(
+                str(r.get("notification_id")) for r in result.get("results", []) if "error" not in r
+            )
+            errors += result.get("failed", 0)
+        elif message["name"] == "get_notification_status":
+            statuses.append(f"{result.get('id')}={result.get('status')}")
+        elif message["name"] == "list_notifications":
+            listings += 1
+    
+    parts = [
+        f"created {len(created)} notifications ({', '.join(created) or 'none'})",
+        f"statuses: {', '.join(statuses) or 'none'}",
+        f"{listings} listings",
+        f"{errors} errors",
+    ]
+    return " ".join(earlier + [f"[summary: {'; '.join(parts)}]"])
+
+
+def _compact_history(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Replace all but the last _KEEP_RECENT_ROUNDS tool rounds with a summary.
+    
+    A round is an assistant message carrying tool_calls plus its tool
+    replies. Rounds are dropped whole so every remaining tool reply still
+    answers a tool_call_id the model can see.
+    """
+    rounds = [i for i, message in enumerate(messages) if message.get("tool_calls")]
+    if len(rounds) <= _KEEP_RECENT_ROUNDS:
+        return messages
+    
+    cut = rounds[-_KEEP_RECENT_ROUNDS]
+    # messages[:2] is the system prompt and the user request
+    summary = {"role": "assistant", "content": _summarize_rounds(messages[2:cut])}
+    return messages[:2] + [summary] + messages[cut:]
+
+
+# Final answers to read-only requests are kept on disk, so repeating the
+# same CLI request (demos, development) skips both OpenAI and Nimbus.
+_RESPONSE_CACHE_DIR = os.path.expanduser("~/.nimbus/agent_cache")
+_RESPONSE_CACHE_TTL = 300
+_PROMPT_FINGERPRINT = _SYSTEM_MSG + _json_dumps(_COMPLETION_PARAMS)
+_MUTATING_INTENT = re.compile(r"send|create|delete", re.IGNORECASE)
+# Tools with side effects. The regex above only catches some wordings
+# ("Email bob..." slips through), so a run that calls any of these is never
+# cached either.
+_MUTATING_TOOLS = frozenset({"create_notification", "create_notifications_bulk"})
+
+
+def has_mutating_intent(user_request: str) -> bool:
+    """Heuristic pre-check: requests that may change state are never answered from cache."""
+    return _MUTATING_INTENT.search(user_request) is not None
+
 
-def run_agent(user_request: str, max_iterations: int = 5) -> str:
+@functools.lru_cache(maxsize=None)
+def _response_cache() -> diskcache.Cache:
+    return diskcache.Cache(_RESPONSE_CACHE_DIR)
+
+
+def _response_cache_key(user_request: str) -> str:
+    # NIMBUS_BASE_URL is read at call time: main() overrides it from --nimbus-url,
+    # and answers from one gateway must not be served for another.
+    material = user_request + NIMBUS_BASE_URL + _PROMPT_FINGERPRINT
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+async def _stream_completion(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, Any]],
+    on_delta: Optional[Callable[[str], None]] = None,
+    on_interim: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Request the next assistant turn with stream=True.
+    
+    Content deltas are forwarded to on_delta as soon as they arrive, so the
+    final answer reaches the user while the model is still generating.
+    Tool call fragments are stitched back together by their index.
+    
+    A turn can open with text ("Let me check...") and still turn out to be
+    a tool turn. When its first tool call fragment arrives, on_interim is
+    called (if any text was already forwarded) so the caller can mark that
+    text as interim, and the rest of the turn's content is not forwarded.
+    
+    Returns:
+        The assembled assistant message, ready to append to the history
+    """
+    stream = await client.chat.completions.create(messages=messages, **_COMPLETION_PARAMS)
+    
+    content: List[str] = []
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        
+        if delta.tool_calls and not tool_calls and content and on_interim:
+            on_interim()
+        
+        if delta.content:
+            content.append(delta.content)
+            if on_delta and not tool_calls and not delta.tool_calls:
+                on_delta(delta.content)
+        
+        for fragment in delta.tool_calls or []:
+            call = tool_calls.setdefault(
+                fragment.index,
+                {"id": None, "type": "function", "function": {"name": "", "arguments": ""}},
+            )
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function:
+                if fragment.function.name:
+                    call["function"]["name"] = fragment.function.name
+                if fragment.function.arguments:
+                    call["function"]["arguments"] += fragment.function.arguments
+    
+    message: Dict[str, Any] = {"role": "assistant", "content": "".join(content) or None}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    return message
+
+
+async def _health_check(session: httpx.AsyncClient) -> bool:
+    """Probe Nimbus /health. Returns False only if Nimbus is unreachable."""
+    try:
+        resp = await session.get("/health", timeout=2)
+        if resp.status_code != 200:
+            print("Warning: Nimbus health check failed. Is it running?")
+            print(f"   Start with: cd ~/workspace/nimbus && go run cmd/gateway/main.go\n")
+    except httpx.TransportError:
+        print("Error: Nimbus is not running!")
+        print(f"   Start with: cd ~/workspace/nimbus && go run cmd/gateway/main.go")
+        print(f"   Then retry this script.\n")
+        return False
+    return True
+
+
+async def run_agent_async(
+    user_request: str,
+    max_iterations: int = 5,
+    on_delta: Optional[Callable[[str], None]] = None,
+    check_health: bool = False,
+    use_cache: bool = False,
+    on_interim: Optional[Callable[[], None]] = None,
+) -> str:
     """
     Run the LLM agent with function calling.
     
     The agent can call Nimbus APIs multiple times to fulfill complex requests.
+    When the LLM asks for several tools in one turn, they run concurrently
+    over a single shared HTTP session.
     
     Args:
         user_request: Natural language request from user
         max_iterations: Max number of function call loops (prevents infinite loops)
+        on_delta: Optional callback receiving response text as it streams in
+        check_health: Probe Nimbus /health alongside the first LLM call and
+            stop before running any tool if Nimbus is unreachable
+        use_cache: Answer read-only requests from the on-disk response cache
+            when possible, and store new answers there
+        on_interim: Optional callback invoked when text already passed to
+            on_delta turns out to belong to a turn that calls tools, i.e. it
+            was not the final answer
     
     Returns:
         Final assistant response
     """
+    cache_key = None
+    if use_cache and not has_mutating_intent(user_request):
+        cache_key = _response_cache_key(user_request)
+        cached = _response_cache().get(cache_key)
+        logger.debug("response cache %s: %s", "hit" if cached is not None else "miss", cache_key)
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached
+    
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise SystemExit("Missing OPENAI_API_KEY. Export it first.")
     
-    client = OpenAI(api_key=api_key)
+    client = AsyncOpenAI(api_key=api_key)
     
+    # The system prompt and NIMBUS_TOOLS never change between iterations, so
+    # every request shares the same prefix and benefits from OpenAI's
+    # automatic prompt caching. Compaction below only ever rewrites turns
+    # after the system prompt and user request.
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are Nimbus AI, an assistant that manages notifications. "
-                "You can create notifications, check their status, and list recent notifications. "
-                "Use UUIDs: tenant_id=00000000-0000-0000-0000-000000000001, "
-                "user_id=00000000-0000-0000-0000-000000000002 as defaults. "
-                "Be concise and friendly."
-            ),
-        },
+        {"role": "system", "content": _SYSTEM_MSG},
         {"role": "user", "content": user_request},
     ]
     
     iteration = 0
     
-    while iteration < max_iterations:
-        iteration += 1
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            tools=NIMBUS_TOOLS,
-            tool_choice="auto",
-            temperature=0.2,
-        )
-        
-        message = response.choices[0].message
-        messages.append(message)
-        
-        # If no tool calls, we're done
-        if not message.tool_calls:
-            return message.content
+    session = httpx.AsyncClient(
+        base_url=NIMBUS_BASE_URL, http2=True, timeout=5.0, limits=_HTTP_LIMITS
+    )
+    async with client, session:
+        # The health check only gates tool execution, so it runs while the
+        # model is still reasoning about the first turn.
+        health = asyncio.create_task(_health_check(session)) if check_health else None
         
-        # Execute each tool call
-        for tool_call in message.tool_calls:
-            func_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
+        while iteration < max_iterations:
+            iteration += 1
             
-            print(f"\nCalling: {func_name}")
-            print(f"   Args: {json.dumps(arguments, indent=2)}")
+            message = await _stream_completion(client, messages, on_delta, on_interim)
+            messages.append(message)
             
-            result = execute_function(func_name, arguments)
+            # If no tool calls, we're done
+            if not message.get("tool_calls"):
+                if health is not None:
+                    health.cancel()
+                if cache_key is not None and message["content"]:
+                    _response_cache().set(cache_key, message["content"], expire=_RESPONSE_CACHE_TTL)
+                return message["content"]
             
-            print(f"   Result: {json.dumps(result, indent=2)}")
+            if health is not None:
+                healthy = await health
+                health = None
+                if not healthy:
+                    return "Nimbus is not running, so no notifications were touched. Start it and retry."
             
-            # Add function result to messages
-            messages.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": func_name,
-                    "content": json.dumps(result),
-                }
+            # Identical calls (same function, same arguments) in one turn
+            # only run once; each tool_call_id still gets its own reply.
+            calls: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            for tool_call in message["tool_calls"]:
+                key = (tool_call["function"]["name"], tool_call["function"]["arguments"])
+                if key in calls:
+                    logger.debug("skipping duplicate call %s", key[0])
+                    continue
+                
+                func_name, arguments = key[0], orjson.loads(key[1])
+                
+                logger.info("Calling: %s", func_name)
+                logger.debug("call %s args=%s", func_name, arguments)
+                
+                calls[key] = arguments
+            
+            # Execute all tool calls concurrently; gather() keeps input order
+            results = await asyncio.gather(
+                *(
+                    execute_function_async(session, func_name, arguments)
+                    for (func_name, _), arguments in calls.items()
+                )
             )
+            results_by_call = dict(zip(calls, results))
+            
+            # An answer built on a failed call (e.g. "Nimbus is unavailable")
+            # must not be replayed from the cache after Nimbus recovers, and
+            # replaying one that sent notifications would silently skip them.
+            if any("error" in result or result.get("failed") for result in results):
+                cache_key = None
+            if any(func_name in _MUTATING_TOOLS for func_name, _ in calls):
+                cache_key = None
+            
+            for key, result in results_by_call.items():
+                logger.debug("%s result=%s", key[0], result)
+            
+            for tool_call in message["tool_calls"]:
+                result = results_by_call[
+                    (tool_call["function"]["name"], tool_call["function"]["arguments"])
+                ]
+                
+                # Add function result to messages
+                messages.append(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call["id"],
+                        "name": tool_call["function"]["name"],
+                        "content": _json_dumps(result),
+                    }
+                )
+            
+            if _count_tokens(messages) > _HISTORY_TOKEN_BUDGET:
+                messages = _compact_history(messages)
+                logger.debug("compacted history to %d messages", len(messages))
     
     return "Max iterations reached. Please try again with a simpler request."
 
 
+def run_agent(
+    user_request: str,
+    max_iterations: int = 5,
+    on_delta: Optional[Callable[[str], None]] = None,
+    check_health: bool = False,
+    use_cache: bool = False,
+    on_interim: Optional[Callable[[], None]] = None,
+) -> str:
+    """Blocking wrapper around run_agent_async()."""
+    return asyncio.run(
+        run_agent_async(
+            user_request, max_iterations, on_delta, check_health, use_cache, on_interim
+        )
+    )
+
+
 # ============================================================
 # CLI
 # ============================================================
@@ -336,32 +1138,65 @@ def main():
         default="http://localhost:8080",
         help="Nimbus API base URL",
     )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log tool call arguments and results",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run the agent, even if a cached answer exists",
+    )
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # httpx logs every request at INFO; keep the CLI output to our own lines
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    
     global NIMBUS_BASE_URL
     NIMBUS_BASE_URL = args.nimbus_url
+    _CLIENT.base_url = NIMBUS_BASE_URL
     
     print(f"Nimbus Integration Demo")
     print(f"   Nimbus URL: {NIMBUS_BASE_URL}")
     print(f"   Request: {args.request}\n")
     
-    # Check if Nimbus is running
-    try:
-        resp = requests.get(f"{NIMBUS_BASE_URL}/health", timeout=2)
-        if resp.status_code != 200:
-            print("Warning: Nimbus health check failed. Is it running?")
-            print(f"   Start with: cd ~/workspace/nimbus && go run cmd/gateway/main.go\n")
-    except requests.RequestException:
-        print("Error: Nimbus is not running!")
-        print(f"   Start with: cd ~/workspace/nimbus && go run cmd/gateway/main.go")
-        print(f"   Then retry this script.\n")
-        return
+    streamed = False
     
-    final_response = run_agent(args.request)
+    def print_delta(text: str) -> None:
+        nonlocal streamed
+        if not streamed:
+            print("\n" + "=" * 60)
+            print("Final Response:")
+            streamed = True
+        print(text, end="", flush=True)
     
-    print("\n" + "=" * 60)
-    print("Final Response:")
-    print(final_response)
+    def mark_interim() -> None:
+        # The text streamed so far preceded a tool call; the real answer
+        # gets its own banner once the tools have run.
+        nonlocal streamed
+        print("\n(interim message, not the final response: calling tools...)")
+        print("=" * 60)
+        streamed = False
+    
+    final_response = run_agent(
+        args.request,
+        on_delta=print_delta,
+        check_health=True,
+        use_cache=not args.no_cache,
+        on_interim=mark_interim,
+    )
+    
+    if streamed:
+        print()
+    else:
+        print("\n" + "=" * 60)
+        print("Final Response:")
+        print(final_response)
     print("=" * 60)
 
 